@@ -2,19 +2,25 @@
 Epub Book Generator
 """
 import os
+import sys
+import copy
 import uuid
 import shutil
 import zipfile
 import tempfile
 import logging
+import multiprocessing
 from logging import Logger
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from collections import Counter
 from dataclasses import dataclass, field
-from typing import NamedTuple, Optional, Tuple, List
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple, Type, List
 
 from PIL import Image, ImageDraw, ImageFont
 from jinja2 import Environment, FileSystemLoader, Template
 
+from .cache import bytecode_cache
 from .chapter import Chapter
 from .factory import ChapterFactory, SimpleChapterFactory
 
@@ -24,6 +30,9 @@ __all__ = ['AssignedChapter', 'Assignment', 'EpubSpec', 'EpubBuilder']
 #: assigned chapter type definition
 AssignedChapter = Tuple['Assignment', Chapter]
 
+#: process-pool build task type definition
+BuildTask = Tuple[Type['EpubBuilder'], 'EpubSpec', List[AssignedChapter], Optional[str]]
+
 #: base library directory
 BASE = os.path.dirname(__file__)
 
@@ -33,31 +42,79 @@ STATIC = os.path.join(BASE, 'static/')
 #: templates directory to render content from
 TEMPLATES = os.path.join(BASE, 'templates/')
 
-#: jinja2 environment to load templates
-jinja_env = Environment(loader=FileSystemLoader(TEMPLATES))
+#: jinja2 environment to load templates (w/ best-effort bytecode cache)
+jinja_env = Environment(
+    loader=FileSystemLoader(TEMPLATES),
+    bytecode_cache=bytecode_cache(),
+    auto_reload=False,
+)
+
+#: preloaded chapter page template
+PAGE_TMPL = jinja_env.get_template('page.xhtml.j2')
+
+#: preloaded coverpage template
+COVER_TMPL = jinja_env.get_template('coverpage.xhtml.j2')
+
+#: preloaded ncx index template
+NCX_TMPL = jinja_env.get_template('book.ncx.j2')
+
+#: preloaded opf package template
+OPF_TMPL = jinja_env.get_template('book.opf.j2')
+
+#: epub mimetype declaration that must be the first stored zip entry
+MIMETYPE_BYTES = b'application/epub+zip'
+
+#: precomputed zip-info for the uncompressed mimetype entry
+MIMETYPE_INFO = zipfile.ZipInfo('mimetype')
+MIMETYPE_INFO.compress_type = zipfile.ZIP_STORED
+
+#: extensions of already compressed media stored without deflate
+STORED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'mp3', 'mp4', 'ogg'}
 
 #: default logging instance for library
 default_logger = logging.getLogger('pypub')
 
 #** Functions **#
 
+def build_tmpdir() -> Optional[str]:
+    """
+    retrieve parent directory for temporary build trees
+
+    set `$PYPUB_TMPDIR` (e.g. to a tmpfs like `/dev/shm`) to opt into
+    building somewhere other than the `tempfile` default directory
+    """
+    return os.environ.get('PYPUB_TMPDIR') or None
+
 def epub_dirs(basedir: Optional[str] = None) -> 'EpubDirs':
     """generate directories for epub data"""
-    basedir = basedir or tempfile.mkdtemp()
+    basedir = basedir or tempfile.mkdtemp(dir=build_tmpdir())
     oebps   = os.path.join(basedir, 'OEBPS')
     metainf = os.path.join(basedir, 'META-INF')
     images  = os.path.join(oebps, 'images')
     styles  = os.path.join(oebps, 'styles')
-    os.makedirs(oebps)
     os.makedirs(metainf)
     os.makedirs(images)
     os.makedirs(styles)
     return EpubDirs(basedir, oebps, metainf, images, styles)
 
+def iter_files(base: str) -> Iterator[Tuple[os.DirEntry, str]]:
+    """iterate files in directory-tree w/ their archive path relative to base"""
+    stack = [(base, '')]
+    while stack:
+        path, relpath = stack.pop()
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir():
+                    stack.append((entry.path, f'{relpath}{entry.name}/'))
+                    continue
+                yield entry, relpath + entry.name
+
 def copy_file(src: str, into: str):
     """copy filepath into the `into` directory"""
     fname = os.path.basename(src)
     dst   = os.path.join(into, fname)
+    # copyfile guards same-file and special-file copies and already
+    # copies in-kernel w/ sendfile on linux
     shutil.copyfile(src, dst)
 
 def copy_static(fpath: str, into: str):
@@ -65,18 +122,37 @@ def copy_static(fpath: str, into: str):
     src = os.path.join(STATIC, fpath)
     copy_file(src, into)
 
+def epub_path(title: str, fpath: Optional[str] = None) -> str:
+    """build final epub filepath w/ defaults from the given title"""
+    fname = os.path.basename(fpath) if fpath else title
+    fname = fname if fname.endswith('.epub') else fname + '.epub'
+    fpath = os.path.dirname(fpath) if fpath else '.'
+    return os.path.join(fpath, fname)
+
 def get_extension(fname: str) -> str:
-    """get extension of the given filename"""
-    return fname.rsplit('.', 1)[-1]
-
-def render_template(name: str, into: str, encoding: str, kwargs: dict):
-    """render template in templates directory"""
-    fname    = name.rsplit('.j2', 1)[0]
-    dest     = os.path.join(into, os.path.basename(fname))
-    template = jinja_env.get_template(name)
-    content  = template.render(**kwargs)
-    with open(dest, 'w', encoding=encoding) as f:
-        f.write(content)
+    """get lowercase extension of the given filename"""
+    return fname.rpartition('.')[2].lower()
+
+def render_all(templates: List[Template], encoding: str, kwargs: dict) -> Dict[str, bytes]:
+    """render preloaded templates against one shared context into bytes"""
+    contents = {}
+    context  = templates[0].new_context(kwargs)
+    for template in templates:
+        fname = (template.name or '').rsplit('.j2', 1)[0]
+        try:
+            content = template.environment.concat(
+                template.root_render_func(context))
+        except Exception:
+            template.environment.handle_exception()
+        contents[fname] = content.encode(encoding)
+    return contents
+
+def build_one(args: 'BuildTask') -> str:
+    """build a single epub from its spec and chapters (process-pool worker)"""
+    builder_factory, spec, chapters, fpath = args
+    with builder_factory(spec) as builder:
+        builder.render_chapters(chapters)
+        return builder.finalize(fpath)
 
 #** Classes **#
 
@@ -103,34 +179,85 @@ class EpubSpec:
     """
     Epub Builder Specification
     """
-    title:     str
-    creator:   str            = 'pypub'
-    subtitle:  str            = ''
-    language:  str            = 'en'
-    rights:    str            = ''
-    publisher: str            = 'pypub'
-    encoding:  str            = 'utf-8'
-    date:      datetime       = field(default_factory=datetime.now)
-    epub_dir:  Optional[str]  = None
-    factory:   ChapterFactory = field(repr=False, default_factory=SimpleChapterFactory)
-    logger:    Logger         = field(repr=False, default=default_logger)
-    css_paths: List[str]      = field(repr=False, default_factory=list)
+    title:         str
+    creator:       str            = 'pypub'
+    subtitle:      str            = ''
+    language:      str            = 'en'
+    rights:        str            = ''
+    publisher:     str            = 'pypub'
+    encoding:      str            = 'utf-8'
+    date:          datetime       = field(default_factory=datetime.now)
+    epub_dir:      Optional[str]  = None
+    factory:       ChapterFactory = field(repr=False, default_factory=SimpleChapterFactory)
+    logger:        Logger         = field(repr=False, default=default_logger)
+    css_paths:     List[str]      = field(repr=False, default_factory=list)
+    compresslevel: int            = 3
+    max_workers:   int            = 1
 
 class EpubBuilder:
     """
     Epub Builder Class for Constructing Epub Books
     """
 
-    def __init__(self, epub: EpubSpec):
-        self.uid      = str(uuid.uuid4())
+    def __init__(self, epub: EpubSpec, uid: Optional[str] = None):
+        self.uid      = uid or str(uuid.uuid4())
         self.epub     = epub
         self.logger   = epub.logger
         self.factory  = epub.factory
         self.encoding = epub.encoding
         self.dirs:     Optional[EpubDirs]    = None
-        self.template: Optional[Template]    = None
+        self.template: Template              = PAGE_TMPL
         self.chapters: List[AssignedChapter] = []
+        self.contents: Dict[str, bytes]      = {}
+        self.styles:   List[str]             = []
     
+    @classmethod
+    def new_batch(cls, specs: List[EpubSpec]) -> List['EpubBuilder']:
+        """generate builders for many specs w/ a single entropy read"""
+        entropy = os.urandom(16 * len(specs))
+        return [
+            cls(spec, str(uuid.UUID(bytes=entropy[n*16:(n+1)*16], version=4)))
+            for n, spec in enumerate(specs)
+        ]
+
+    @classmethod
+    def build_many(cls,
+        books:   List[Tuple[EpubSpec, List[AssignedChapter]]],
+        outdir:  Optional[str] = None,
+        workers: Optional[int] = None,
+    ) -> List[str]:
+        """
+        build many epubs in parallel across a pool of worker processes
+
+        NOTE: specs and chapters are pickled to the workers, and outside
+        of linux workers are spawned, so callers must guard their
+        entrypoint with `if __name__ == '__main__':`
+
+        :param books:   list of epub specs and their assigned chapters
+        :param outdir:  directory to write epubs into (defaults to cwd)
+        :param workers: max worker processes (defaults to cpu-count)
+        :return:        filepaths of finished epubs in order of books
+        """
+        tasks = [
+            (cls, spec, chapters, os.path.join(outdir, spec.title) if outdir else None)
+            for spec, chapters in books
+        ]
+        # workers write straight to their final path so they must not collide
+        fpaths = [os.path.abspath(epub_path(spec.title, fpath))
+            for _, spec, _, fpath in tasks]
+        duplicates = [fpath for fpath, n in Counter(fpaths).items() if n > 1]
+        if duplicates:
+            raise ValueError(f'duplicate epub output paths: {sorted(duplicates)}')
+        if not tasks:
+            return []
+        # fork shares preloaded templates w/ workers w/o re-parsing them
+        # (only on linux, macos defaults to spawn as forking is unsafe there)
+        fork    = sys.platform.startswith('linux')
+        context = multiprocessing.get_context('fork' if fork else None)
+        workers = min(len(tasks), workers or os.cpu_count() or 1)
+        with context.Pool(workers) as pool:
+            return pool.map(build_one, tasks)
+
     def __enter__(self):
         """begin epub building in context-manager"""
         self.begin()
@@ -142,46 +269,86 @@ class EpubBuilder:
 
     def begin(self) -> EpubDirs:
         """begin building operations w/ basic file structure"""
-        # read jinja2 chapter template
-        if not self.template:
-            self.template = jinja_env.get_template('page.xhtml.j2')
         if self.dirs:
             return self.dirs
         
         # generate base directories and copy static files
         self.dirs = epub_dirs(self.epub.epub_dir)
-        copy_static('mimetype', self.dirs.basedir)
-        copy_static('container.xml', self.dirs.metainf)
-        copy_static('css/coverpage.css', self.dirs.styles)
-        copy_static('css/styles.css', self.dirs.styles)
-        for path in self.epub.css_paths:
-            copy_file(path, self.dirs.styles)
-        fpath    = os.path.join(self.dirs.oebps, 'coverpage.xhtml')
+        with ThreadPoolExecutor(8) as pool:
+            statics = [
+                pool.submit(copy_static, 'container.xml', self.dirs.metainf),
+                pool.submit(copy_static, 'css/coverpage.css', self.dirs.styles),
+                pool.submit(copy_static, 'css/styles.css', self.dirs.styles),
+            ]
+            for task in statics:
+                task.result()
+            # custom stylesheets override packaged ones (last listed wins)
+            paths  = {os.path.basename(path): path for path in self.epub.css_paths}
+            copies = [pool.submit(copy_file, path, self.dirs.styles)
+                for path in paths.values()]
+            for task in copies:
+                task.result()
+        # track copied stylesheets w/o re-reading the directory
+        styles = ['coverpage.css', 'styles.css']
+        styles.extend(os.path.basename(path) for path in self.epub.css_paths)
+        self.styles = list(dict.fromkeys(styles))
         kwargs = {
             'epub':     self.epub, 
-            'styles':   os.listdir(self.dirs.styles),
+            'styles':   self.styles,
+            'title':    self.epub.title,
+            'subtitle': self.epub.subtitle,
+            'rights':   self.epub.rights,
         }
-        # content  = template.render(**kwargs)
-        with open(fpath, 'w', encoding=self.encoding) as f:
-            cover = self.template.render(**kwargs)
-            f.write(cover)
+        cover = COVER_TMPL.render(**kwargs).encode(self.encoding)
+        self.contents['OEBPS/coverpage.xhtml'] = cover
         return self.dirs
 
+    def _render(self, assign: Assignment, chapter: Chapter) -> bytes:
+        """render an assigned chapter into bytes w/ the chapter factory"""
+        assert self.dirs is not None
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug('rendering chapter #%d: %r',
+                assign.play_order, chapter.title)
+        args   = (self.logger, chapter, self.dirs.images, self.template)
+        kwargs = {'epub': self.epub, 'chapter': chapter}
+        return self.factory.render(*args, kwargs)
+
     def render_chapter(self, assign: Assignment, chapter: Chapter):
         """render an assigned chapter into the ebook"""
-        if not self.dirs or not self.template:
+        if not self.dirs:
             raise RuntimeError('cannot render_chapter before `begin`')
-        # log chapter generation
+        content = self._render(assign, chapter)
         self.chapters.append((assign, chapter))
-        self.logger.debug('rendering chapter #%d: %r' % (
-            assign.play_order, chapter.title))
-        # render chapter w/ appropriate kwargs
-        args    = (self.logger, chapter, self.dirs.images, self.template)
-        kwargs  = {'epub': self.epub, 'chapter': chapter}
-        fpath   = os.path.join(self.dirs.oebps, assign.link)
-        content = self.factory.render(*args, kwargs)
-        with open(fpath, 'wb') as f:
-            f.write(content)
+        self.contents[f'OEBPS/{assign.link}'] = content
+
+    def render_chapters(self,
+        chapters:    List[AssignedChapter],
+        max_workers: Optional[int] = None,
+    ):
+        """
+        render several assigned chapters into the ebook in play-order
+
+        NOTE: chapters are only rendered concurrently when more than one
+        worker is requested, which requires a thread-safe chapter factory
+
+        :param chapters:    assigned chapters to render
+        :param max_workers: render threads (defaults to `epub.max_workers`)
+        """
+        if not self.dirs:
+            raise RuntimeError('cannot render_chapters before `begin`')
+        chapters = sorted(chapters, key=lambda ac: ac[0].play_order)
+        workers  = max_workers or self.epub.max_workers
+        if workers <= 1:
+            for assign, chapter in chapters:
+                self.render_chapter(assign, chapter)
+            return
+        # render chapters in thread-pool to overlap downloads and parsing
+        with ThreadPoolExecutor(workers) as pool:
+            contents = list(pool.map(lambda ac: self._render(*ac), chapters))
+        # collect results in play-order on the calling thread
+        for (assign, chapter), content in zip(chapters, contents):
+            self.chapters.append((assign, chapter))
+            self.contents[f'OEBPS/{assign.link}'] = content
 
     def index(self):
         """build index files for epub before finalizing"""
@@ -190,7 +357,7 @@ class EpubBuilder:
         kwargs = {
             'uid':      self.uid,
             'epub':     self.epub, 
-            'styles':   os.listdir(self.dirs.styles),
+            'styles':   self.styles,
             'chapters': self.chapters,
             'images':   [
                 MimeFile(fname, get_extension(fname))
@@ -198,33 +365,50 @@ class EpubBuilder:
             ]
         }
         # render and write the rest of the templates
-        self.logger.debug('epub=%r, writing final templates' % self.epub.title)
-        render_template('book.ncx.j2', self.dirs.oebps, self.encoding, kwargs)
-        render_template('book.opf.j2', self.dirs.oebps, self.encoding, kwargs)
+        self.logger.debug('epub=%r, writing final templates', self.epub.title)
+        contents = render_all([NCX_TMPL, OPF_TMPL], self.encoding, kwargs)
+        for fname, content in contents.items():
+            self.contents[f'OEBPS/{fname}'] = content
+
+    def dump(self):
+        """write rendered in-memory content out into the epub directory"""
+        if not self.dirs:
+            raise RuntimeError('cannot dump epub before `begin`')
+        fpath = os.path.join(self.dirs.basedir, 'mimetype')
+        with open(fpath, 'wb') as f:
+            f.write(MIMETYPE_BYTES)
+        for local, content in self.contents.items():
+            fpath = os.path.join(self.dirs.basedir, local)
+            with open(fpath, 'wb') as f:
+                f.write(content)
 
     def compress(self, fpath: Optional[str] = None) -> str:
-        """compress build and zip content into epub"""
+        """compress build and stream rendered content into epub"""
         if not self.dirs:
             raise RuntimeError('cannot finalize before `begin`')
-        # reformat and build fpath w/ defaults
-        fname = os.path.basename(fpath) if fpath else self.epub.title
-        fname = fname.rsplit('.epub', 1)[0] + '.epub'
-        fpath = os.path.dirname(fpath) if fpath else '.'
-        fpath = os.path.join(fpath, fname)
-        fzip  = fpath.rsplit('.epub', 1)[0] + '.zip'
-        # zip contents of directory 
-        self.logger.debug('epub=%r, zipping content' % self.epub.title)
-        zipf = zipfile.ZipFile(fzip, 'w', zipfile.ZIP_DEFLATED)
-        for root, _, files in os.walk(self.dirs.basedir):
-            relpath = root.split(self.dirs.basedir, 1)[1]
-            for file in files:
-                real   = os.path.join(root, file)
-                local  = os.path.join(relpath, file)
-                method = zipfile.ZIP_STORED if file == 'mimetype' else None
-                zipf.write(real, local, method)
-        # rename zip to epub
-        zipf.close()
-        os.rename(fzip, fpath)
+        fpath = epub_path(self.epub.title, fpath)
+        # zip contents of directory straight into the final epub
+        self.logger.debug('epub=%r, zipping content', self.epub.title)
+        zipf = zipfile.ZipFile(fpath, 'w', zipfile.ZIP_DEFLATED,
+            compresslevel=self.epub.compresslevel)
+        try:
+            with zipf:
+                # zipinfo is mutated on write so each archive gets a copy
+                zipf.writestr(copy.copy(MIMETYPE_INFO), MIMETYPE_BYTES)
+                for entry, local in iter_files(self.dirs.basedir):
+                    if local == 'mimetype' or local in self.contents:
+                        continue
+                    ext    = get_extension(entry.name)
+                    stored = ext in STORED_EXTENSIONS
+                    method = zipfile.ZIP_STORED if stored else None
+                    zipf.write(entry.path, local, method)
+                # stream rendered content directly into zip
+                for local, content in self.contents.items():
+                    zipf.writestr(local, content)
+        except BaseException:
+            # never leave a half-written epub behind
+            os.remove(fpath)
+            raise
         return fpath
 
     def finalize(self, fpath: Optional[str] = None) -> str:
@@ -237,3 +421,5 @@ class EpubBuilder:
         if self.dirs:
             shutil.rmtree(self.dirs.basedir, ignore_errors=True)
             self.dirs = None
+        self.contents.clear()
+        self.styles.clear()
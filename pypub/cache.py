@@ -0,0 +1,45 @@
+"""
+Best-Effort Jinja2 Template Bytecode Cache
+"""
+from typing import Optional
+
+from jinja2 import FileSystemBytecodeCache
+from jinja2.bccache import Bucket, BytecodeCache
+
+#** Variables **#
+__all__ = ['SafeBytecodeCache', 'bytecode_cache']
+
+#: filename pattern for cached template bytecode
+CACHE_PATTERN = '__pypub_jinja2_%s.cache'
+
+#** Functions **#
+
+def bytecode_cache() -> Optional[BytecodeCache]:
+    """
+    build on-disk template bytecode cache if the temp directory is usable
+
+    :return: bytecode cache or none when the cache directory is unusable
+    """
+    try:
+        return SafeBytecodeCache(pattern=CACHE_PATTERN)
+    except (OSError, RuntimeError):
+        return None
+
+#** Classes **#
+
+class SafeBytecodeCache(FileSystemBytecodeCache):
+    """Filesystem Bytecode Cache that never fails Template Loading"""
+
+    def load_bytecode(self, bucket: Bucket):
+        """load cached bytecode, ignoring filesystem errors"""
+        try:
+            super().load_bytecode(bucket)
+        except OSError:
+            pass
+
+    def dump_bytecode(self, bucket: Bucket):
+        """dump compiled bytecode, ignoring filesystem errors"""
+        try:
+            super().dump_bytecode(bucket)
+        except OSError:
+            pass
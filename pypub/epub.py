@@ -42,8 +42,19 @@ class Epub(EpubSpec):
         """
         assignment = self.assign_chapter()
         self.chapters.append((assignment, chapter))
-        self.logger.debug(f'epub=%r added chapter %d: %r' % (
-            self.title, assignment.play_order, chapter.title))
+        self.logger.debug('epub=%r added chapter %d: %r',
+            self.title, assignment.play_order, chapter.title)
+
+    def render(self) -> str:
+        """
+        render chapters and index files in preparation for compression
+
+        :return: directory of epub static content
+        """
+        dirs = self.builder.begin()
+        self.builder.render_chapters(self.chapters)
+        self.builder.index()
+        return dirs.basedir
 
     def build_epub_dir(self) -> str:
         """
@@ -51,11 +62,9 @@ class Epub(EpubSpec):
 
         :return: directory of epub content
         """
-        dirs = self.builder.begin()
-        for assign, chapter in self.chapters:
-            self.builder.render_chapter(assign, chapter)
-        self.builder.index()
-        return dirs.basedir 
+        basedir = self.render()
+        self.builder.dump()
+        return basedir
  
     def create(self, fpath: Optional[str] = None) -> str:
         """
@@ -65,7 +74,7 @@ class Epub(EpubSpec):
         :return:      filepath of finished epub
         """
         try:
-            self.build_epub_dir()
+            self.render()
             return self.builder.compress(fpath)
         finally:
             self.builder.cleanup()
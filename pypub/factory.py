@@ -34,6 +34,9 @@ __all__ = [
 #: unicode characters to replace if found in content
 REPLACE = dict([(ord(x), ord(y)) for x,y in zip(u"‘’´“”–-", u"'''\"\"--")])
 
+#: buffer size used when writing downloaded images to disk in chunks
+WRITE_BUFFER = 256 * 1024
+
 #: supported tags and attributes allowed in an epub
 SUPPORTED_TAGS = {
     'a':          ('href', 'id'),
@@ -98,7 +101,7 @@ def render_images(ctx: 'RenderCtx', chunk_size: int = 8192):
             image.attrib['src'] = downloads[url]
             continue
         # download url into local image folder for epub
-        ctx.logger.debug(f'chapter[%s] downloading image: %r' % fmt)
+        ctx.logger.debug('chapter[%s] downloading image: %r', *fmt)
         try:
             res = urlrequest(url, timeout=ctx.timeout)
             # ensure status of response is valid
@@ -114,7 +117,7 @@ def render_images(ctx: 'RenderCtx', chunk_size: int = 8192):
             fname = f'image-{uuid.uuid4()}.{mime}'
             fpath = os.path.join(ctx.imagedir, fname)
             # read rest of the content into associated file
-            with open(fpath, 'wb') as f:
+            with open(fpath, 'wb', buffering=WRITE_BUFFER) as f:
                 while chunk:
                     f.write(chunk)
                     chunk = res.read(chunk_size)
@@ -168,6 +171,12 @@ class RenderCtx:
     timeout:       int  = 10
 
 class ChapterFactory(Protocol):
+    """
+    Chapter Rendering Factory Interface
+
+    NOTE: factories are only required to be thread-safe when used with an
+    `EpubSpec.max_workers` above one, which renders chapters concurrently
+    """
     
     @abstractmethod
     def cleanup_html(self, content: bytes) -> HtmlElement:
@@ -4,7 +4,7 @@ Pypub Unit Tests
 import os
 
 #** Variables **#
-__all__ = ['ChapterTests', 'FactoryTests', 'EpubTests']
+__all__ = ['CacheTests', 'ChapterTests', 'FactoryTests', 'EpubTests']
 
 #: static testing files directory
 STATIC = os.path.realpath(os.path.join(os.path.dirname(__file__), 'static'))
@@ -14,5 +14,6 @@ LOCAL_IMAGE = os.path.join(STATIC, 'sample.png')
 
 #** Imports **#
 from .epub import EpubTests
+from .cache import CacheTests
 from .chapter import ChapterTests
 from .factory import FactoryTests
@@ -0,0 +1,41 @@
+"""
+Template Bytecode Cache Unit Tests
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from jinja2 import Environment, FileSystemLoader
+
+from . import LOCAL_IMAGE
+from ..builder import TEMPLATES
+from ..cache import SafeBytecodeCache, bytecode_cache
+
+#** Variables **#
+__all__ = ['CacheTests']
+
+#** Tests **#
+
+class CacheTests(unittest.TestCase):
+    """Template Bytecode Cache UnitTests"""
+
+    def test_unusable_tempdir(self):
+        """ensure an unusable temp directory disables the cache"""
+        with mock.patch.object(tempfile, 'tempdir', LOCAL_IMAGE):
+            self.assertIsNone(bytecode_cache())
+
+    def test_unwritable_cache(self):
+        """ensure cache write failures never break template loading"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            missing  = os.path.join(tmpdir, 'missing')
+            cache    = SafeBytecodeCache(missing)
+            env      = Environment(
+                loader=FileSystemLoader(TEMPLATES), bytecode_cache=cache)
+            template = env.get_template('page.xhtml.j2')
+        self.assertIsNotNone(template)
+
+#** Main **#
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,15 @@
 import os
+import uuid
+import shutil
+import zipfile
+import tempfile
 import unittest
 from typing import Set
 
 from . import LOCAL_IMAGE, STATIC
 from ..epub import Epub
-from ..chapter import create_chapter_from_file
+from ..builder import Assignment, EpubBuilder, EpubSpec, copy_file, epub_dirs
+from ..chapter import create_chapter_from_file, create_chapter_from_html, create_chapter_from_text
 
 #** Variables **#
 __all__ = ['EpubTests']
@@ -45,6 +50,136 @@ class EpubTests(unittest.TestCase):
         finally:
             self.epub.builder.cleanup()
  
+    def test_compress_epub(self):
+        """ensure rendered content is streamed directly into the epub"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fpath = self.epub.create(os.path.join(tmpdir, 'test.epub'))
+            with zipfile.ZipFile(fpath) as zipf:
+                names = zipf.namelist()
+                first = zipf.infolist()[0]
+                mime  = zipf.read('mimetype')
+        self.assertEqual(names[0], 'mimetype')
+        self.assertEqual(first.compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(mime, b'application/epub+zip')
+        self.assertEqual(len(names), len(set(names)), 'duplicate entries')
+        self.assertIn('OEBPS/chapter-1.xhtml', names)
+        self.assertIn('OEBPS/book.ncx', names)
+        self.assertIn('OEBPS/book.opf', names)
+
+    def test_compress_methods(self):
+        """ensure images are stored while text content is deflated"""
+        html = f'<body><p>image</p><img src="file://{LOCAL_IMAGE}"/></body>'
+        self.epub.add_chapter(create_chapter_from_html(html.encode(), 'image'))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fpath = self.epub.create(os.path.join(tmpdir, 'test.epub'))
+            with zipfile.ZipFile(fpath) as zipf:
+                infos = zipf.infolist()
+        images = [i for i in infos if i.filename.startswith('OEBPS/images/')]
+        self.assertTrue(images, 'no images in epub')
+        for info in infos:
+            stored = info.filename == 'mimetype' or info in images
+            method = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+            self.assertEqual(info.compress_type, method, info.filename)
+
+    def test_copy_same_file(self):
+        """ensure copying a file onto itself never truncates it"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fpath = os.path.join(tmpdir, 'styles.css')
+            with open(fpath, 'wb') as f:
+                f.write(b'content')
+            with self.assertRaises(shutil.SameFileError):
+                copy_file(fpath, tmpdir)
+            with open(fpath, 'rb') as f:
+                self.assertEqual(f.read(), b'content')
+
+    def test_reuse_epub_dir(self):
+        """ensure an existing epub build tree is never silently reused"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            epub_dirs(tmpdir)
+            with self.assertRaises(FileExistsError):
+                epub_dirs(tmpdir)
+
+    def test_custom_styles(self):
+        """ensure custom stylesheets override packaged ones w/o collisions"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = []
+            for n, content in enumerate((b'first', b'second' * 100000)):
+                os.makedirs(os.path.join(tmpdir, str(n)))
+                path = os.path.join(tmpdir, str(n), 'styles.css')
+                with open(path, 'wb') as f:
+                    f.write(content)
+                paths.append(path)
+            for _ in range(10):
+                spec = EpubSpec('title', css_paths=paths)
+                with EpubBuilder(spec) as builder:
+                    assert builder.dirs is not None
+                    fpath = os.path.join(builder.dirs.styles, 'styles.css')
+                    with open(fpath, 'rb') as f:
+                        content = f.read()
+                    styles = list(builder.styles)
+                self.assertEqual(content, b'second' * 100000)
+                self.assertEqual(styles, ['coverpage.css', 'styles.css'])
+
+    def test_coverpage(self):
+        """ensure coverpage is rendered w/ the book metadata"""
+        self.epub.subtitle = 'subtitle'
+        self.epub.rights   = 'rights'
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fpath = self.epub.create(os.path.join(tmpdir, 'test.epub'))
+            with zipfile.ZipFile(fpath) as zipf:
+                cover = zipf.read('OEBPS/coverpage.xhtml')
+        self.assertIn(b'<title>title</title>', cover)
+        self.assertIn(b'<h1>title</h1>', cover)
+        self.assertIn(b'<h3>subtitle</h3>', cover)
+        self.assertIn(b'<h4>rights</h4>', cover)
+        self.assertNotIn(b'DEFAULT', cover)
+
+    def test_render_chapters_order(self):
+        """ensure chapters are recorded in play-order w/ and w/o threads"""
+        chapters = [
+            (Assignment(f'chapter_{n}', f'chapter-{n}.xhtml', n),
+                create_chapter_from_text(f'chapter {n}', f'title {n}'))
+            for n in (3, 1, 2)
+        ]
+        for workers in (1, 4):
+            with EpubBuilder(EpubSpec('title')) as builder:
+                builder.render_chapters(chapters, max_workers=workers)
+                orders = [assign.play_order for assign, _ in builder.chapters]
+                titles = [chapter.title for _, chapter in builder.chapters]
+                links  = list(builder.contents)[1:]
+            self.assertEqual(orders, [1, 2, 3])
+            self.assertEqual(titles, ['title 1', 'title 2', 'title 3'])
+            self.assertEqual(links, [f'OEBPS/chapter-{n}.xhtml' for n in (1, 2, 3)])
+
+    def test_new_batch(self):
+        """ensure batch builders are assigned distinct version-4 uuids"""
+        specs    = [EpubSpec(f'title {n}') for n in range(5)]
+        builders = EpubBuilder.new_batch(specs)
+        uids     = [builder.uid for builder in builders]
+        self.assertEqual([builder.epub for builder in builders], specs)
+        self.assertEqual(len(set(uids)), len(specs), 'duplicate uids')
+        for uid in uids:
+            self.assertEqual(str(uuid.UUID(uid)), uid)
+            self.assertEqual(uuid.UUID(uid).version, 4)
+
+    def test_build_many(self):
+        """ensure multiple epubs can be built across worker processes"""
+        books = [(EpubSpec('title'), self.epub.chapters), (EpubSpec('title2'), [])]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fpaths = EpubBuilder.build_many(books, tmpdir, workers=2)
+            names  = [os.path.basename(fpath) for fpath in fpaths]
+            self.assertEqual(names, ['title.epub', 'title2.epub'])
+            for fpath in fpaths:
+                self.assertTrue(zipfile.is_zipfile(fpath), 'invalid epub')
+
+    def test_build_many_duplicates(self):
+        """ensure books writing to the same epub path are rejected"""
+        books = [(EpubSpec('title'), []), (EpubSpec('title'), [])]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with self.assertRaises(ValueError):
+                EpubBuilder.build_many(books, tmpdir, workers=2)
+            self.assertEqual(os.listdir(tmpdir), [])
+
     def test_custom_cover(self):
         """ensure custom cover generation works as intended"""
         self.epub.cover = LOCAL_IMAGE